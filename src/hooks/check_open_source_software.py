@@ -23,61 +23,124 @@
 ###
 
 
+from __future__ import annotations
+
 import json
 import logging
+import os
 import subprocess
-
-from rich.console import Console
-from rich.table import Table
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional
 
 from .utils import (
+    get_content_hash,
+    get_scan_settings_hash,
     get_staged_files,
+    has_scan_results,
+    load_content_cache,
     log_and_exit,
-    maybe_remove_old_results,
-    maybe_setup_results_dir,
+    prepare_results_dir,
+    save_content_cache,
     set_bom_settings,
+    split_files_for_command,
+    start_staged_files_lookup,
 )
 
+# rich and scanoss are imported where they are used so runs without staged files skip their import cost
+if TYPE_CHECKING:
+    from rich.console import Console
+    from rich.table import Table
+
 DEFAULT_SCANOSS_SETTINGS_FILE = "scanoss.json"
 DEFAULT_SBOM_FILE = "SBOM.json"
-DEFAULT_RESULTS_DIR = ".scanoss"
+DEFAULT_RESULTS_DIR = Path(".scanoss")
 DEFAULT_RESULTS_FILENAME = "results.json"
-DEFAULT_RESULTS_PATH = f"{DEFAULT_RESULTS_DIR}/{DEFAULT_RESULTS_FILENAME}"
+DEFAULT_RESULTS_PATH = DEFAULT_RESULTS_DIR / DEFAULT_RESULTS_FILENAME
+DEFAULT_CONTENT_CACHE_FILENAME = "content_cache.json"
+DEFAULT_CONTENT_CACHE_PATH = DEFAULT_RESULTS_DIR / DEFAULT_CONTENT_CACHE_FILENAME
+DEFAULT_CONTENT_CACHE_MAX_AGE = 24 * 60 * 60
+# Environment variables that change the server or account scanoss-py scans against
+SCANOSS_SETTINGS_ENV_VARS = ["SCANOSS_SCAN_URL", "SCANOSS_GRPC_URL", "SCANOSS_API_KEY"]
 
-console = Console()
-
-logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+# Column header and results field of the pending files table
+RESULTS_TABLE_COLUMNS = (
+    ("File", "file"),
+    ("Status", "status"),
+    ("Match Type", "match_type"),
+    ("Matched", "matched"),
+    ("Purl", "purl"),
+    ("License", "license"),
 )
 
+console = None
+
 
 def main():
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+
     scanoss_scan_cmd = [
         "scanoss-py",
         "scan",
         "--no-wfp-output",
-        "--output",
-        DEFAULT_RESULTS_PATH,
     ]
 
+    # Let git read the index while the scan command and results directory are prepared
+    git_proc = start_staged_files_lookup()
+
     set_bom_settings(scanoss_scan_cmd, DEFAULT_SCANOSS_SETTINGS_FILE, DEFAULT_SBOM_FILE)
 
-    maybe_setup_results_dir(DEFAULT_RESULTS_DIR)
-    maybe_remove_old_results(DEFAULT_RESULTS_PATH)
+    prepare_results_dir(DEFAULT_RESULTS_PATH)
 
-    staged_files = get_staged_files()
+    staged_files = get_staged_files(git_proc)
     if not staged_files:
         log_and_exit("No files to scan. Skipping SCANOSS.", 0)
 
-    scanoss_scan_cmd.extend(["--files", *staged_files])
+    # Cached results are only valid for the same scan options and settings
+    cache_key = get_scan_settings_hash(
+        scanoss_scan_cmd,
+        [DEFAULT_SCANOSS_SETTINGS_FILE, DEFAULT_SBOM_FILE],
+        SCANOSS_SETTINGS_ENV_VARS,
+    )
+    cache = load_content_cache(
+        DEFAULT_CONTENT_CACHE_PATH, cache_key, DEFAULT_CONTENT_CACHE_MAX_AGE
+    )
+    content_hashes = {file: get_content_hash(file) for file in staged_files}
+    cached_results = {}
+    files_to_scan = []
+    for file in staged_files:
+        cached_result = get_cached_result(cache, file, content_hashes[file])
+        if cached_result is None:
+            files_to_scan.append(file)
+        else:
+            cached_results[file] = cached_result
+
+    if files_to_scan:
+        scan_files(scanoss_scan_cmd, files_to_scan)
 
-    run_scan(scanoss_scan_cmd)
+    apply_content_cache(cache, content_hashes, files_to_scan, cached_results)
 
     present_results()
 
     exit(0)
 
 
+def scan_files(scan_cmd: list[str], files: list[str]) -> None:
+    """Scan the given files into the results file.
+
+    Args:
+        scan_cmd (list[str]): SCANOSS scan command without output or files
+        files (list[str]): files to scan
+    """
+    output_args = ["--output", os.fspath(DEFAULT_RESULTS_PATH)]
+    file_batches = split_files_for_command([*scan_cmd, *output_args, "--files"], files)
+    if len(file_batches) == 1:
+        run_scan([*scan_cmd, *output_args, "--files", *files])
+    else:
+        run_scan_in_batches(scan_cmd, file_batches)
+
+
 def run_scan(scan_cmd: list[str]) -> None:
     """Run the SCANOSS scan command.
 
@@ -90,63 +153,217 @@ def run_scan(scan_cmd: list[str]) -> None:
         log_and_exit(f"SCANOSS scan failed: {e}", 1)
 
 
+def run_scan_in_batches(scan_cmd: list[str], file_batches: list[list[str]]) -> None:
+    """Run the SCANOSS scan command once per batch of files and merge the results.
+
+    Used when the staged files do not fit in a single command line.
+
+    Args:
+        scan_cmd (list[str]): SCANOSS scan command without output or files
+        file_batches (list[list[str]]): files to scan, split in batches
+    """
+    batch_results_paths = []
+    for i, files in enumerate(file_batches):
+        batch_results_path = DEFAULT_RESULTS_DIR / f"results_{i}.json"
+        # scanoss-py appends to the output file
+        batch_results_path.unlink(missing_ok=True)
+        run_scan(
+            [*scan_cmd, "--output", os.fspath(batch_results_path), "--files", *files]
+        )
+        batch_results_paths.append(batch_results_path)
+
+    merge_results(batch_results_paths, DEFAULT_RESULTS_PATH)
+
+
+def merge_results(batch_results_paths: list[Path], results_path: Path) -> None:
+    """Merge the results of every scan batch into a single results file.
+
+    Args:
+        batch_results_paths (list[Path]): results files of each scan batch
+        results_path (Path): merged results file
+    """
+    results = {}
+    for batch_results_path in batch_results_paths:
+        with batch_results_path.open("rb") as f:
+            results.update(json.load(f))
+        batch_results_path.unlink()
+
+    results_path.write_bytes(json.dumps(results, indent=2).encode())
+
+
+def get_cached_result(
+    cache: dict, file: str, content_hash: Optional[str]
+) -> Optional[list]:
+    """Get the cached scan result of a file whose path and contents are unchanged.
+
+    Args:
+        cache (dict): content cache loaded by load_content_cache
+        file (str): path of the file
+        content_hash (Optional[str]): content hash of the file
+
+    Returns:
+        Optional[list]: cached scan result or None if the file has to be scanned
+    """
+    cached_file = cache["files"].get(file)
+    if (
+        content_hash is None
+        or cached_file is None
+        or cached_file["hash"] != content_hash
+    ):
+        return None
+    return cached_file["result"]
+
+
+def apply_content_cache(
+    cache: dict,
+    content_hashes: dict[str, Optional[str]],
+    scanned_files: list[str],
+    cached_results: dict[str, list],
+) -> None:
+    """Cache the results of the scanned files and add the cached results to the results file.
+
+    Args:
+        cache (dict): content cache loaded by load_content_cache
+        content_hashes (dict[str, Optional[str]]): content hash of every staged file
+        scanned_files (list[str]): files scanned in this run
+        cached_results (dict[str, list]): cached scan results of the files not scanned
+    """
+    results = {}
+    if scanned_files:
+        with DEFAULT_RESULTS_PATH.open("rb") as f:
+            results = json.load(f)
+        for file in scanned_files:
+            content_hash = content_hashes[file]
+            # scanoss-py skips files by path, so only files it reported on are cached
+            if content_hash is not None and file in results:
+                cache["files"][file] = {"hash": content_hash, "result": results[file]}
+        save_content_cache(DEFAULT_CONTENT_CACHE_PATH, cache)
+
+    if cached_results:
+        results.update(cached_results)
+        DEFAULT_RESULTS_PATH.write_bytes(json.dumps(results, indent=2).encode())
+
+
 def present_results() -> None:
     """Present the SCANOSS scan results."""
     try:
+        # Nothing to review when none of the staged files were scanned (e.g. docs only commits)
+        if not has_scan_results(DEFAULT_RESULTS_PATH):
+            return
+
+        try:
+            from scanoss.results import Results
+        except ImportError:  # scanoss-py is available only as a CLI
+            Results = None
+
+        # Load the results in-process when possible to avoid another scanoss-py start up.
+        if Results is not None:
+            results = Results(
+                filepath=DEFAULT_RESULTS_PATH
+            ).get_pending_identifications()
+            if results.has_results():
+                present_results_table(format_pending_results(results.data))
+                exit(1)
+            return
+
         cmd_result = subprocess.run(
             [
                 "scanoss-py",
                 "results",
-                DEFAULT_RESULTS_PATH,
+                os.fspath(DEFAULT_RESULTS_PATH),
                 "--has-pending",
                 "--format",
                 "json",
             ],
-            capture_output=True,
-            text=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
         )
 
-        scan_results = cmd_result.stdout
-
         # If the return code is 1, SCANOSS detected pending potential Open Source software that needs to be reviewed.
         if cmd_result.returncode == 1:
-            scan_results_json = json.loads(scan_results)
+            # json.loads decodes the UTF-8 bytes itself, no need for a separate text decode pass
+            scan_results_json = json.loads(cmd_result.stdout)
             present_results_table(scan_results_json)
             exit(1)
     except Exception as e:
         log_and_exit(f"SCANOSS results command failed: {e}", 1)
 
 
-def present_results_table(results: dict) -> None:
-    """Present the files pending identification in a table.
+def format_pending_results(pending_files: list[dict]) -> dict:
+    """Format the pending files loaded by scanoss like the 'scanoss-py results --format json' output.
 
     Args:
-        results (dict): files pending identification
+        pending_files (list[dict]): pending files from scanoss.results.Results.data
+
+    Returns:
+        dict: files pending identification and their total
     """
+    formatted_files = [
+        {
+            "file": file.get("filename"),
+            "status": file.get("status", "N/A"),
+            "match_type": file.get("id", "N/A"),
+            "matched": file.get("matched", "N/A"),
+            "purl": file["purl"][0] if file.get("purl") else "N/A",
+            "license": (
+                file["licenses"][0].get("name", "N/A")
+                if file.get("licenses")
+                else "N/A"
+            ),
+        }
+        for file in pending_files
+    ]
+    return {"results": formatted_files, "total": len(formatted_files)}
+
+
+def get_console() -> Console:
+    """Get the console, creating it on first use.
+
+    Returns:
+        Console: rich console
+    """
+    from rich.console import Console
+
+    global console
+    if console is None:
+        console = Console()
+    return console
+
+
+def new_results_table() -> Table:
+    """Create an empty table with a column for each field of a pending file.
+
+    Returns:
+        Table: rich table
+    """
+    from rich.table import Table
+
     table = Table(
         show_header=True,
         header_style="bold magenta",
         show_lines=True,
     )
+    for column, _ in RESULTS_TABLE_COLUMNS:
+        table.add_column(column)
+    return table
 
-    table.add_column("File")
-    table.add_column("Status")
-    table.add_column("Match Type")
-    table.add_column("Matched")
-    table.add_column("Purl")
-    table.add_column("License")
-
-    for file in results.get("results"):
-        table.add_row(
-            file.get("file"),
-            file.get("status"),
-            file.get("match_type"),
-            file.get("matched"),
-            file.get("purl"),
-            file.get("license"),
-        )
+
+def present_results_table(results: dict) -> None:
+    """Present the files pending identification in a table.
+
+    Args:
+        results (dict): files pending identification
+    """
+    from rich.text import Text
+
+    table = new_results_table()
+
+    # Plain Text cells skip console markup parsing, which also keeps brackets in file names intact
+    for file in results["results"]:
+        table.add_row(*(Text(file[key]) for _, key in RESULTS_TABLE_COLUMNS))
+    console = get_console()
     console.print(
-        f"[bold red]SCANOSS detected [cyan]{results.get("total")}[/cyan] files containing potential Open Source Software:[/bold red]"
+        f"[bold red]SCANOSS detected [cyan]{results['total']}[/cyan] files containing potential Open Source Software:[/bold red]"
     )
     console.print(table)
     console.print(
@@ -1,38 +1,194 @@
+import hashlib
+import importlib.metadata
+import json
 import logging
+import os
 import subprocess
+import time
 from pathlib import Path
+from typing import Optional
 
-DEFAULT_RESULTS_PATH = ".scanoss/results.json"
+
+def _get_max_command_length() -> int:
+    """Get the maximum length of a command line, leaving room for the environment."""
+    if os.name == "nt":
+        # CreateProcess limit in UTF-16 code units
+        return 2**15 - 2048
+    environ_size = sum(len(k) + len(v) + 2 + 8 for k, v in os.environb.items())
+    try:
+        arg_max = os.sysconf("SC_ARG_MAX")
+    except (ValueError, OSError):
+        arg_max = 2**17
+    return max(arg_max - environ_size - 64 * 1024, 2**12)
+
+
+MAX_COMMAND_LENGTH = _get_max_command_length()
+
+
+def _command_length(args: list) -> int:
+    """Get the length the arguments take on the command line."""
+    if os.name == "nt":
+        # Quotes and separator around every argument
+        return sum(len(os.fspath(arg).encode("utf-16le")) // 2 + 3 for arg in args)
+    # NUL terminator and argv pointer for every argument
+    return sum(len(os.fsencode(arg)) + 1 + 8 for arg in args)
+
+
+def split_files_for_command(command: list, files: list[str]) -> list[list[str]]:
+    """Split the files in batches so the command with each batch fits in a single command line.
+
+    Args:
+        command (list): command the files will be appended to
+        files (list[str]): files to split
+
+    Returns:
+        list[list[str]]: batches of files, a single batch when all files fit
+    """
+    command_length = _command_length(command)
+    batches = []
+    batch = []
+    batch_length = command_length
+    for file in files:
+        file_length = _command_length([file])
+        if batch and batch_length + file_length > MAX_COMMAND_LENGTH:
+            batches.append(batch)
+            batch = []
+            batch_length = command_length
+        batch.append(file)
+        batch_length += file_length
+    if batch:
+        batches.append(batch)
+    return batches
 
 
 def set_bom_settings(scan_cmd: list[str], settings_file: str, sbom_file: str) -> None:
     """Set the BOM settings file for the scan command if it exists."""
 
-    identify = None
+    # Prefer settings file over legacy sbom file
+    if os.path.isfile(settings_file):
+        scan_cmd.extend(["--settings", settings_file])
+    elif os.path.isfile(sbom_file):
+        scan_cmd.extend(["--identify", sbom_file, "-F", "512"])
+
 
-    settings_file_path = Path(settings_file).resolve()
-    legacy_sbom_file_path = Path(sbom_file).resolve()
+def prepare_results_dir(results_path: Path):
+    """Create the results directory if it does not exist and remove the old results file.
 
-    # Prefer settings file over legacy sbom file
-    if settings_file_path.is_file():
-        identify = str(settings_file_path)
-        scan_cmd.extend(["--settings", identify])
-    elif legacy_sbom_file_path.is_file():
-        identify = str(legacy_sbom_file_path)
-        scan_cmd.extend(["--identify", identify, "-F", "512"])
+    Args:
+        results_path (Path): path to the SCANOSS results file
+    """
+    try:
+        os.mkdir(results_path.parent)
+    except FileExistsError:
+        pass
+    try:
+        os.unlink(results_path)
+    except FileNotFoundError:
+        pass
+
+
+def has_scan_results(results_path: Path) -> bool:
+    """Check if the results file contains any scanned file without parsing it.
+
+    Args:
+        results_path (Path): path to the SCANOSS results file
 
+    Returns:
+        bool: False if the scan wrote an empty JSON object, True otherwise
+    """
+    with results_path.open("rb") as results_file:
+        head = results_file.read(16)
+    return bool(head.strip(b"{} \t\r\n"))
+
+
+def get_content_hash(file_path: str) -> Optional[str]:
+    """Get the hash of a file's contents.
 
-def maybe_setup_results_dir(results_dir: str):
-    """Create the results directory if it does not exist."""
-    results_dir_path = Path(results_dir)
-    results_dir_path.mkdir(exist_ok=True)
+    Args:
+        file_path (str): path to the file
 
+    Returns:
+        Optional[str]: hex digest of the contents or None if the file cannot be read
+    """
+    content_hash = hashlib.blake2b(digest_size=16)
+    try:
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(64 * 1024), b""):
+                content_hash.update(chunk)
+    except OSError:
+        return None
+    return content_hash.hexdigest()
 
-def maybe_remove_old_results(results_path: str):
-    """Remove the old results file if it exists."""
-    results_file = Path(results_path)
-    if results_file.is_file():
-        results_file.unlink(missing_ok=True)
+
+def get_scan_settings_hash(
+    scan_cmd: list[str], settings_files: list[str], settings_env_vars: list[str]
+) -> str:
+    """Get a hash of the scanoss version, scan options, settings files and settings environment variables.
+
+    Args:
+        scan_cmd (list[str]): SCANOSS scan command without output or files
+        settings_files (list[str]): settings files that may affect the scan results
+        settings_env_vars (list[str]): environment variables scanoss-py reads its settings from
+
+    Returns:
+        str: hex digest of the scan settings
+    """
+    try:
+        scanoss_version = importlib.metadata.version("scanoss")
+    except importlib.metadata.PackageNotFoundError:
+        scanoss_version = ""
+
+    settings_hash = hashlib.blake2b(digest_size=16)
+    # scanoss upgrades can change file filtering and results post-processing
+    settings_hash.update(f"scanoss {scanoss_version}\0".encode())
+    settings_hash.update("\0".join(scan_cmd).encode())
+    for settings_file in settings_files:
+        settings_hash.update(f"\0{get_content_hash(settings_file)}".encode())
+    for env_var in settings_env_vars:
+        settings_hash.update(f"\0{env_var}={os.environ.get(env_var, '')}".encode())
+    return settings_hash.hexdigest()
+
+
+def load_content_cache(cache_path: Path, cache_key: str, max_age: int) -> dict:
+    """Load the scan results cached by file content hash.
+
+    Args:
+        cache_path (Path): path to the content cache file
+        cache_key (str): hash of the scan settings the cache must have been built with
+        max_age (int): maximum age of the cache in seconds
+
+    Returns:
+        dict: the cache, or a new empty cache if it is missing, stale or built with other settings
+    """
+    try:
+        with cache_path.open("rb") as f:
+            cache = json.load(f)
+        # A cache created in the future (clock skew, copied from another machine) is stale too
+        if (
+            cache["key"] == cache_key
+            and 0 <= time.time() - cache["created"] <= max_age
+            and isinstance(cache["files"], dict)
+            and all(
+                isinstance(cached_file, dict)
+                and "hash" in cached_file
+                and "result" in cached_file
+                for cached_file in cache["files"].values()
+            )
+        ):
+            return cache
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return {"key": cache_key, "created": time.time(), "files": {}}
+
+
+def save_content_cache(cache_path: Path, cache: dict) -> None:
+    """Save the scan results cached by file content hash.
+
+    Args:
+        cache_path (Path): path to the content cache file
+        cache (dict): cache loaded by load_content_cache
+    """
+    cache_path.write_bytes(json.dumps(cache).encode())
 
 
 def log_and_exit(message: str, exit_code: int) -> None:
@@ -49,25 +205,45 @@ def log_and_exit(message: str, exit_code: int) -> None:
     exit(exit_code)
 
 
-def get_staged_files() -> list[str]:
+def start_staged_files_lookup() -> Optional[subprocess.Popen]:
+    """Start listing the staged files in the current git repository without waiting for git.
+
+    Returns:
+        Optional[subprocess.Popen]: running git process or None if git could not be started.
+    """
+    try:
+        return subprocess.Popen(
+            ["git", "diff", "--cached", "--name-only", "-z", "--diff-filter=ACMR"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+    except Exception as e:
+        logging.error("%s", e)
+        return None
+
+
+def get_staged_files(git_proc: Optional[subprocess.Popen]) -> list[str]:
     """Get the list of staged files in the current git repository.
 
+    Args:
+        git_proc (Optional[subprocess.Popen]): git process started by start_staged_files_lookup
+
     Returns:
         list[str]: list of staged files or an empty list if no files are staged.
     """
+    if git_proc is None:
+        return []
     try:
-        result = subprocess.run(
-            ["git", "diff", "--cached", "--name-only", "--diff-filter=ACM"],
-            capture_output=True,
-            text=True,
-            check=True,
-        )
+        stdout, _ = git_proc.communicate()
+        if git_proc.returncode != 0:
+            raise subprocess.CalledProcessError(git_proc.returncode, git_proc.args)
 
-        staged_files = result.stdout.strip().split("\n")
-        return [f for f in staged_files if f]
+        # NUL separated paths are neither quoted by git nor split on newlines inside file names.
+        # Every path is NUL terminated, so only the last element is empty.
+        return [os.fsdecode(f) for f in stdout.split(b"\0")[:-1]]
     except subprocess.CalledProcessError as e:
-        logging.error(f"Git command failed: {e}")
+        logging.error("Git command failed: %s", e)
         return []
     except Exception as e:
-        logging.error(f"{e}")
+        logging.error("%s", e)
         return []